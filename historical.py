@@ -1,6 +1,9 @@
 import logging
 import httpx # httpx for async requests
 import asyncio
+import numpy as np
+import orjson
+from pymongo import UpdateOne
 from datetime import datetime, timedelta, timezone
 import persistence
 
@@ -10,7 +13,67 @@ SYMBOL = "BTCUSDT"
 INTERVAL = "1d"
 DAYS_HISTORY_NEEDED = 250 # Need > 200 for SMA(200)
 
-async def fetch_historical_data(redis_client, db):
+def _kline_close_columns(klines) -> tuple[np.ndarray, np.ndarray]:
+    # close prices (column 4) and close times in ms (column 6) as typed arrays
+    # read per column so rows with extra (or differing) trailing fields don't matter
+    close_prices = np.fromiter((k[4] for k in klines), dtype=np.float64, count=len(klines))
+    close_times_ms = np.fromiter((k[6] for k in klines), dtype=np.int64, count=len(klines))
+    return close_prices, close_times_ms
+
+def _is_valid_kline(kline) -> bool:
+    try:
+        float(kline[4])
+        int(kline[6])
+        return True
+    except (IndexError, ValueError, TypeError):
+        return False
+
+def build_bulk_ops(klines: list) -> tuple[list[dict], np.ndarray, list[UpdateOne]]:
+    # returns (documents to save, close prices oldest first, upserts for the documents)
+    # binance kline format: [open_time, open, high, low, close, volume, close_time, ...]
+    try:
+        close_prices, close_times_ms = _kline_close_columns(klines)
+    except (IndexError, ValueError, TypeError) as e:
+        logging.warning(f"Could not parse historical klines in bulk, skipping malformed rows. Error: {e}")
+        close_prices, close_times_ms = _kline_close_columns([k for k in klines if _is_valid_kline(k)])
+
+    # fromiter turns a null or "nan" close into nan instead of raising, drop those rows from both columns
+    finite = np.isfinite(close_prices)
+    if not finite.all():
+        logging.warning(f"Skipping {int((~finite).sum())} historical klines with a non-finite close price.")
+        close_prices = close_prices[finite]
+        close_times_ms = close_times_ms[finite]
+
+    # close_time to determine the date the candle represents
+    close_dts = close_times_ms.astype('datetime64[ms]')
+    day_dates = np.datetime_as_string(close_dts, unit='D').tolist()
+
+    # documents for MongoDB bulk insert
+    documents = [
+        {
+            'date': day_date,
+            'symbol': SYMBOL,
+            'price': close_price,
+            'timestamp_utc': close_dt.replace(tzinfo=timezone.utc),
+            'is_historical': True # flag as historical data
+        }
+        for day_date, close_price, close_dt in zip(day_dates, close_prices.tolist(), close_dts.tolist())
+    ]
+    # only the price can change on re-runs, the remaining fields are written once on insert
+    # (date and symbol come from the filter)
+    bulk_ops = [
+        UpdateOne(
+            {'date': doc['date'], 'symbol': doc['symbol']},
+            {
+                '$setOnInsert': {'timestamp_utc': doc['timestamp_utc'], 'is_historical': doc['is_historical']},
+                '$set': {'price': doc['price']}
+            },
+            upsert=True
+        ) for doc in documents
+    ]
+    return documents, close_prices, bulk_ops
+
+async def fetch_historical_data(redis_client, db, sma_periods: tuple[int, ...] = ()):
     logging.info(f"Starting historical data fetch for {SYMBOL} ({DAYS_HISTORY_NEEDED} days)...")
 
     # start date
@@ -29,14 +92,11 @@ async def fetch_historical_data(redis_client, db):
         'limit': DAYS_HISTORY_NEEDED + 50 # fetching slightly more for safety
     }
 
-    prices_to_cache = []
-    documents_to_save = []
-
     try:
         async with httpx.AsyncClient() as client:
             response = await client.get(BINANCE_KLINE_URL, params=params)
             response.raise_for_status() # raise exception for 4xx/5xx errors
-            klines = response.json()
+            klines = orjson.loads(response.content) # parse the raw bytes directly, skips httpx's stdlib json decode
 
             logging.info(f"Fetched {len(klines)} historical klines from API.")
 
@@ -44,45 +104,21 @@ async def fetch_historical_data(redis_client, db):
                 logging.warning("No historical klines received from API.")
                 return
 
-            for kline in klines:
-                # binance kline format: [open_time, open, high, low, close, volume, close_time, ...]
-                try:
-                    close_time_ms = kline[6]
-                    close_price_str = kline[4]
-
-                    close_price = float(close_price_str)
-                    # close_time to determine the date the candle represents
-                    close_dt = datetime.fromtimestamp(close_time_ms / 1000.0, tz=timezone.utc)
-                    day_date = close_dt.date()
-
-                    prices_to_cache.append(close_price)
-
-                    # document for MongoDB bulk insert
-                    documents_to_save.append({
-                        'date': day_date.isoformat(),
-                        'symbol': SYMBOL,
-                        'price': close_price,
-                        'timestamp_utc': close_dt,
-                        'is_historical': True # flag as historical data
-                    })
-
-                except (IndexError, ValueError, TypeError) as e:
-                    logging.warning(f"Could not parse historical kline: {kline}, Error: {e}")
-                    continue
+            # parsing and building the bulk ops is pure CPU work, keep it off the event loop
+            loop = asyncio.get_running_loop()
+            documents_to_save, close_prices, bulk_ops = await loop.run_in_executor(None, build_bulk_ops, klines)
+            prices_to_cache = close_prices.tolist()
 
             if documents_to_save:
-                 collection = db['daily_derived_prices']
+                 collection = persistence.get_derived_prices_collection(db)
                  logging.info(f"Saving {len(documents_to_save)} historical prices to MongoDB...")
                  try:
-                      from pymongo import UpdateOne
-                      bulk_ops = [
-                          UpdateOne(
-                              {'date': doc['date'], 'symbol': doc['symbol']},
-                              {'$set': doc},
-                              upsert=True
-                          ) for doc in documents_to_save
-                      ]
-                      await collection.bulk_write(bulk_ops, ordered=False)
+                      if await collection.count_documents({'symbol': SYMBOL}, limit=1) == 0:
+                          # cold start: nothing to match against, plain inserts skip the per-doc upsert lookup
+                          # the unique (date, symbol) index from setup_databases keeps this safe
+                          await collection.insert_many(documents_to_save, ordered=False)
+                      else:
+                          await collection.bulk_write(bulk_ops, ordered=False)
                       logging.info("Bulk save to MongoDB complete.")
                  except Exception as e:
                       logging.error(f"MongoDB bulk save failed: {e}", exc_info=True)
@@ -92,12 +128,19 @@ async def fetch_historical_data(redis_client, db):
             if prices_to_cache:
                 key = f"prices:{SYMBOL}:derived_1d"
                 logging.info(f"Populating Redis cache '{key}' with {len(prices_to_cache)} historical prices...")
+                # seeds for the running SMA window sums, summed over the typed array rather than the python list
+                sma_seeds = {period: float(close_prices[-period:].sum()) for period in sma_periods}
                 try:
-                    await redis_client.delete(key) # clear old cache
-                    # push prices (convert to string for Redis) - push oldest first so newest are at head
-                    await redis_client.lpush(key, *[str(p) for p in reversed(prices_to_cache)])
-                    # trim to ensure correct size
-                    await redis_client.ltrim(key, 0, DAYS_HISTORY_NEEDED - 1)
+                    # clear, refill and trim in a single atomic round-trip
+                    # klines come oldest first, so RPUSH leaves the newest price at the tail
+                    async with redis_client.pipeline(transaction=True) as pipe:
+                        pipe.delete(key) # clear old cache
+                        pipe.rpush(key, *prices_to_cache) # floats go straight to the client encoder
+                        pipe.ltrim(key, -DAYS_HISTORY_NEEDED, -1) # keep the latest DAYS_HISTORY_NEEDED prices
+                        pipe.set(f"{key}:order", persistence.PRICE_LIST_ORDER)
+                        for period, seed in sma_seeds.items():
+                            pipe.set(f"sma_sum:{SYMBOL}:{period}", str(seed))
+                        await pipe.execute()
                     logging.info(f"Redis cache '{key}' populated.")
                 except Exception as e:
                     logging.error(f"Failed to populate Redis cache '{key}': {e}", exc_info=True)
@@ -1,27 +1,40 @@
 import asyncio
+import collections
 import websockets
-import json
+import orjson
 import logging
 import time
 import config
-from datetime import datetime, timezone, date
+from datetime import datetime, timedelta, timezone, date
 import persistence
 import historical
 import signal_calculator
 
+try:
+    import uvloop
+except ImportError: # uvloop does not support windows
+    uvloop = None
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s:%(filename)s:%(lineno)d - %(message)s')
 
-async def websocket_listener(queue: asyncio.Queue, redis_client):
+# strong references to fire-and-forget tasks so they are not garbage collected mid-flight
+_background_tasks: set[asyncio.Task] = set()
+
+async def websocket_listener(queue: collections.deque, data_ready: asyncio.Event, redis_client):
     url = config.EXCHANGE_WS_URL
     while True:
         try:
-            async with websockets.connect(url) as ws:
+            # bookTicker frames are tiny: skip permessage-deflate and cap the frame size at 64 KiB
+            # the receive queue limit is raised well above the default so bursts buffer instead of pausing reads
+            async with websockets.connect(
+                url, compression=None, max_size=2**16, max_queue=2**10
+            ) as ws:
                 logging.info(f"WebSocket connected to {url}")
                 await persistence.update_websocket_status(redis_client, "connected")
                 while True:
                     try:
                         message = await ws.recv()
-                        data = json.loads(message)
+                        data = orjson.loads(message)
 
                         processing_ts = time.time()
                         best_bid_str = data.get('b')
@@ -34,12 +47,13 @@ async def websocket_listener(queue: asyncio.Queue, redis_client):
                                 best_bid = float(best_bid_str)
                                 best_ask = float(best_ask_str)
 
-                                await queue.put({
+                                queue.append({
                                     'ts': processing_ts,
                                     'bid': best_bid,
                                     'ask': best_ask,
                                     'update_id': update_id
                                 })
+                                data_ready.set() # wake the processor
                             except (ValueError, TypeError) as parse_err:
                                 logging.warning(f"Could not parse data types in message: {data}, Error: {parse_err}")
 
@@ -47,7 +61,7 @@ async def websocket_listener(queue: asyncio.Queue, redis_client):
                         logging.warning("WebSocket connection closed.")
                         await persistence.update_websocket_status(redis_client, "disconnected")
                         break # to trigger reconnect
-                    except json.JSONDecodeError:
+                    except orjson.JSONDecodeError:
                         logging.warning(f"Could not decode JSON: {message}")
                     except Exception as e:
                         logging.error(f"Error processing WebSocket message: {e}", exc_info=True)
@@ -62,39 +76,107 @@ async def websocket_listener(queue: asyncio.Queue, redis_client):
         logging.info("Attempting to reconnect in 5 seconds...")
         await asyncio.sleep(5) # simple backoff
 
-async def data_processor(queue: asyncio.Queue, redis_client, mongo_db):
+def _utc_date(timestamp: float) -> date:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).date()
+
+def _is_valid_tick(item: dict) -> bool:
+    if item['bid'] <= 0 or item['ask'] <= 0:
+        logging.warning(f"Received invalid bid/ask price: {item}")
+        return False
+    return True
+
+def _day_end_ts(day: date) -> float:
+    # unix timestamp of the next UTC midnight
+    return datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc).timestamp()
+
+def _latest_per_day(batch: list[dict], current_day_end_ts: float) -> list[dict]:
+    # ticks arrive in time order, so the last valid tick of each UTC day is all the processor needs
+    if batch[-1]['ts'] < current_day_end_ts:
+        # common case, the whole batch falls within the current day
+        for item in reversed(batch):
+            if _is_valid_tick(item):
+                return [item]
+        return []
+
+    latest = {}
+    for item in batch:
+        if _is_valid_tick(item):
+            latest[_utc_date(item['ts'])] = item
+    return list(latest.values())
+
+async def _update_smas(redis_client, mongo_db, symbol: str, derived_close_day: date, derived_close_price: float):
+    # short lived lock so only one coroutine (or instance) rolls the cache and checks the crossover at a time
+    lock_name = f"sma:{symbol}"
+    try:
+        lock_token = await persistence.acquire_lock(redis_client, lock_name, ttl=60)
+    except Exception as e:
+        logging.error(f"[{symbol}] Could not acquire SMA lock for {derived_close_day}, cache update and crossover check skipped: {e}", exc_info=True)
+        return
+    if lock_token is None:
+        logging.warning(f"[{symbol}] SMA update for {derived_close_day} already in progress elsewhere. Skipping.")
+        return
+
+    try:
+        price_count, smas, previous_smas = await persistence.update_derived_price_cache(
+            redis_client, symbol, derived_close_price, signal_calculator.LONG_SMA_PERIOD + 50,
+            sma_periods=(signal_calculator.SHORT_SMA_PERIOD, signal_calculator.LONG_SMA_PERIOD)
+        )
+
+        logging.info(f"[{symbol}] Triggering SMA crossover check for completed day: {derived_close_day}")
+        # once a day, nothing to run it concurrently with
+        await signal_calculator.check_sma_crossover(
+            redis_client=redis_client,
+            mongo_db=mongo_db,
+            calculation_date=derived_close_day,
+            derived_close_price=derived_close_price,
+            price_count=price_count,
+            smas=smas,
+            previous_smas=previous_smas
+        )
+    except Exception as e:
+        # keep the processor running if the update fails
+        logging.error(f"[{symbol}] SMA update failed for {derived_close_day}: {e}", exc_info=True)
+    finally:
+        await persistence.release_lock(redis_client, lock_name, lock_token)
+
+async def data_processor(queue: collections.deque, data_ready: asyncio.Event, redis_client, mongo_db):
     logging.info("Data processor started.")
     current_day: date | None = None
+    current_day_end_ts = 0.0 # nothing is within the current day until it is set
     last_mid_price: float | None = None
     symbol = signal_calculator.SYMBOL
 
     while True:
         try:
-            item = await queue.get()
-            timestamp = item['ts']
-            bid = item['bid']
-            ask = item['ask']
-
-            if bid <= 0 or ask <= 0:
-                logging.warning(f"Received invalid bid/ask price: {item}")
-                queue.task_done()
+            if not queue:
+                await data_ready.wait()
+                data_ready.clear()
                 continue
-
-            mid_price = (bid + ask) / 2.0
-
-            event_dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
-            event_date = event_dt.date()
-
-            # first run init
-            if current_day is None:
-                current_day = event_date
-                last_mid_price = mid_price
-                logging.info(f"Processor initialized. Current day set to: {current_day}, Initial mid: {mid_price:.2f}")
-                queue.task_done()
-                continue
-
-            # day change check
-            if event_date > current_day:
+            # take everything buffered in one go, only the last tick of each day can change state
+            batch = list(queue)
+            queue.clear()
+
+            for item in _latest_per_day(batch, current_day_end_ts):
+                timestamp = item['ts']
+                mid_price = (item['bid'] + item['ask']) / 2.0
+
+                if timestamp < current_day_end_ts:
+                    # same day, just updating the last known price
+                    last_mid_price = mid_price
+                    continue
+
+                # only reached on init or when crossing into a new day
+                event_date = _utc_date(timestamp)
+
+                # first run init
+                if current_day is None:
+                    current_day = event_date
+                    current_day_end_ts = _day_end_ts(current_day)
+                    last_mid_price = mid_price
+                    logging.info(f"Processor initialized. Current day set to: {current_day}, Initial mid: {mid_price:.2f}")
+                    continue
+
+                # day change
                 logging.info(f"Day boundary crossed. Old day: {current_day}, New day: {event_date}")
 
                 if last_mid_price is not None:
@@ -102,38 +184,22 @@ async def data_processor(queue: asyncio.Queue, redis_client, mongo_db):
                     derived_close_day = current_day # most recent day
                     logging.info(f"*** [{symbol}] Derived Close for {derived_close_day}: {derived_close_price:.2f} ***")
 
-                    await persistence.save_derived_price(mongo_db, derived_close_day, derived_close_price, symbol)
-                    await persistence.add_derived_price_to_cache(redis_client, symbol, derived_close_price, signal_calculator.LONG_SMA_PERIOD + 50)
-
-                    logging.info(f"[{symbol}] Triggering SMA crossover check for completed day: {derived_close_day}")
-                    asyncio.create_task(
-                        signal_calculator.check_sma_crossover(
-                            redis_client=redis_client,
-                            mongo_db=mongo_db,
-                            calculation_date=derived_close_day,
-                            derived_close_price=derived_close_price
-                        )
-                    )
+                    # mongo write runs alongside, the crossover check only needs the redis state
+                    save_task = asyncio.create_task(persistence.save_derived_price(mongo_db, derived_close_day, derived_close_price, symbol))
+                    # the loop only keeps a weak reference, hold on to the task until it is done
+                    _background_tasks.add(save_task)
+                    save_task.add_done_callback(_background_tasks.discard)
+                    await _update_smas(redis_client, mongo_db, symbol, derived_close_day, derived_close_price)
                 else:
                     logging.warning(f"[{symbol}] Day boundary crossed but last_mid_price was None for {current_day}. Skipping derived close.")
-                
+
                 # update state for the new day
                 current_day = event_date
+                current_day_end_ts = _day_end_ts(current_day)
                 last_mid_price = mid_price
-            
-            elif event_date == current_day:
-                # same day, just updating the last known price
-                last_mid_price = mid_price
-            
-            else: # should not happen in live feed
-                logging.warning(f"Received data from the past.")
-            
-            queue.task_done()
         
         except KeyError as e:
             logging.error(f"Missing key in queue item: {e}. Item: {item if 'item' in locals() else 'unknown'}")
-            if 'queue' in locals():
-                queue.task_done() # marking to prevent blocking
         except Exception as e:
             logging.error(f"Error in data processor: {e}", exc_info=True)
             await asyncio.sleep(1) # small delay before retrying to prevent fast error loops
@@ -146,12 +212,17 @@ async def main():
         redis_client = persistence.get_redis_client()
         mongo_db = persistence.get_mongo_db()
 
-        await historical.fetch_historical_data(redis_client, mongo_db)
+        await historical.fetch_historical_data(
+            redis_client, mongo_db,
+            sma_periods=(signal_calculator.SHORT_SMA_PERIOD, signal_calculator.LONG_SMA_PERIOD)
+        )
         
-        data_queue = asyncio.Queue(maxsize=1000) # defining a maxsize to prevent infinite growth
+        # single consumer, so a bounded deque plus an event is enough. maxlen drops the oldest ticks instead of growing forever
+        data_queue = collections.deque(maxlen=1000)
+        data_ready = asyncio.Event()
 
-        listener_task = asyncio.create_task(websocket_listener(data_queue, redis_client))
-        processor_task = asyncio.create_task(data_processor(data_queue, redis_client, mongo_db))
+        listener_task = asyncio.create_task(websocket_listener(data_queue, data_ready, redis_client))
+        processor_task = asyncio.create_task(data_processor(data_queue, data_ready, redis_client, mongo_db))
 
         # weakness: if one task crashes, gather will exit. need more robust supervision here
         await asyncio.gather(
@@ -168,4 +239,7 @@ async def main():
         logging.info("Application shutdown complete.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.run(main()) # libuv based event loop, motor and redis.asyncio pick it up automatically
+    else:
+        asyncio.run(main())
\ No newline at end of file
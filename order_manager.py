@@ -1,16 +1,36 @@
 import logging
 import asyncio
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import persistence
 import historical
 
 SYMBOL = historical.SYMBOL
 
+# position each signal type leads to
+SIGNAL_TARGET_POSITIONS = {"BUY": "LONG", "SELL": "FLAT"}
+
 async def process_signal(redis_client, mongo_db, signal_type: str, price_at_signal: float):
     logging.info(f"[{SYMBOL}] Order Manager received signal: {signal_type} at price {price_at_signal:.2f}")
 
-    # get current position state from Redis
-    current_position = await persistence.get_position(redis_client, SYMBOL)
+    # single clock read shared by whichever order gets built
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    # the date the signal derived from, rough estimate
+    signal_based_on_date = datetime.combine(today - timedelta(days=1) if now.hour < 1 else today, datetime.min.time(), tzinfo=timezone.utc)
+
+    target_position = SIGNAL_TARGET_POSITIONS.get(signal_type)
+    if target_position is None:
+        logging.warning(f"[{SYMBOL}] Order Manager received unknown signal type: {signal_type}")
+        return
+
+    # swap in the target position and get the current one back in a single round-trip
+    # a BUY while LONG or a SELL while FLAT just rewrites the same state
+    try:
+        current_position = await persistence.swap_position(redis_client, SYMBOL, target_position)
+    except Exception as e:
+        # position state is unknown, don't simulate an order against it
+        logging.error(f"[{SYMBOL}] Failed to swap position state in Redis, skipping order for {signal_type}: {e}", exc_info=True)
+        return
     if current_position is None:
         # init position if it doesn't exist
         logging.info(f"[{SYMBOL}] No existing position found in Redis. Initializing to FLAT.")
@@ -19,22 +39,20 @@ async def process_signal(redis_client, mongo_db, signal_type: str, price_at_sign
     logging.info(f"[{SYMBOL}] Current position state: {current_position}")
 
     order_to_log = None
-    new_position = current_position # default to no change
 
     # determine action based on signal and current position
     if signal_type == "BUY":
         if current_position == "FLAT":
             logging.info(f"[{SYMBOL}] BUY signal received while FLAT. Simulating MARKET BUY order.")
             order_to_log = {
-                'timestamp': datetime.now(timezone.utc), # order placement time
+                'timestamp': now, # order placement time
                 'symbol': SYMBOL,
                 'side': 'BUY',
                 'type': 'MARKET', # assuming market orders for simplicity
                 'price': price_at_signal, # price at which the signal occurred
                 'status': 'SIMULATED_FILLED', # instantly filled in simulation
-                'signal_based_on_date': datetime.combine(datetime.now(timezone.utc).date() - timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc) if datetime.now(timezone.utc).hour < 1 else datetime.combine(datetime.now(timezone.utc).date(), datetime.min.time(), tzinfo=timezone.utc) # the date the signal derived from, rough estimate
+                'signal_based_on_date': signal_based_on_date
             }
-            new_position = "LONG"
         else: # already LONG
             logging.info(f"[{SYMBOL}] BUY signal received but already LONG. No action taken.")
 
@@ -42,34 +60,26 @@ async def process_signal(redis_client, mongo_db, signal_type: str, price_at_sign
         if current_position == "LONG":
             logging.info(f"[{SYMBOL}] SELL signal received while LONG. Simulating MARKET SELL order.")
             order_to_log = {
-                'timestamp': datetime.now(timezone.utc),
+                'timestamp': now,
                 'symbol': SYMBOL,
                 'side': 'SELL',
                 'type': 'MARKET',
                 'price': price_at_signal,
                 'status': 'SIMULATED_FILLED',
-                'signal_based_on_date': datetime.combine(datetime.now(timezone.utc).date() - timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc) if datetime.now(timezone.utc).hour < 1 else datetime.combine(datetime.now(timezone.utc).date(), datetime.min.time(), tzinfo=timezone.utc) # the date the signal derived from, rough estimate
+                'signal_based_on_date': signal_based_on_date
             }
-            new_position = "FLAT"
         else: # already FLAT
             logging.info(f"[{SYMBOL}] SELL signal received but already FLAT. No action taken.")
 
-    else:
-        logging.warning(f"[{SYMBOL}] Order Manager received unknown signal type: {signal_type}")
 
-
-    # if an order was generated, log it and update position state
+    # if an order was generated, log it (position state was already swapped above)
     if order_to_log:
         try:
             await persistence.save_order(mongo_db, order_to_log)
             logging.info(f"[{SYMBOL}] Successfully logged simulated {order_to_log['side']} order to MongoDB.")
 
-            # update position state in Redis *after* successfully logging order
-            await persistence.set_position(redis_client, SYMBOL, new_position)
-            logging.info(f"[{SYMBOL}] Position state updated in Redis to: {new_position}")
-
         except Exception as e:
-            logging.error(f"[{SYMBOL}] Failed to log order or update position for signal {signal_type}: {e}", exc_info=True)
+            logging.error(f"[{SYMBOL}] Failed to log order for signal {signal_type}: {e}", exc_info=True)
 
     else:
         logging.debug(f"[{SYMBOL}] No order generated for signal {signal_type} and position {current_position}.")
\ No newline at end of file
@@ -1,5 +1,8 @@
 import logging
+import secrets
 from motor.motor_asyncio import AsyncIOMotorClient
+import bson
+from pymongo import ASCENDING, WriteConcern
 import redis.asyncio as redis
 from datetime import date, datetime, timezone
 from config import MONGO_CONN_STRING, MONGO_DB_NAME, REDIS_HOST, REDIS_PORT
@@ -7,12 +10,21 @@ from config import MONGO_CONN_STRING, MONGO_DB_NAME, REDIS_HOST, REDIS_PORT
 _mongo_client = None
 _redis_client = None
 
+# derived prices can always be re-derived or backfilled, so skip waiting on the journal for them
+DERIVED_PRICES_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+# stored under prices:<symbol>:derived_1d:order, marks a price list written oldest first (newest at the tail)
+PRICE_LIST_ORDER = "oldest_first"
+
 def get_mongo_db():
     global _mongo_client
     if _mongo_client is None:
         raise ConnectionError("MongoDB client not initialized.")
     return _mongo_client[MONGO_DB_NAME]
 
+def get_derived_prices_collection(db):
+    return db.get_collection('daily_derived_prices', write_concern=DERIVED_PRICES_WRITE_CONCERN)
+
 def get_redis_client():
     global _redis_client
     if _redis_client is None:
@@ -23,11 +35,24 @@ async def setup_databases():
     global _mongo_client, _redis_client
     logging.info("Setting up database connections...")
     try:
-        _mongo_client = AsyncIOMotorClient(MONGO_CONN_STRING)
+        if not bson.has_c():
+            logging.warning("PyMongo C extensions are not available, BSON encoding falls back to pure Python.")
+        # small pool for the few concurrent writers, zstd keeps the backfill small on the wire
+        _mongo_client = AsyncIOMotorClient(MONGO_CONN_STRING, maxPoolSize=5, compressors='zstd')
         await _mongo_client.admin.command('ping') # ensuring connection
         logging.info(f"MongoDB connected successfully to {MONGO_CONN_STRING}")
 
-        _redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        # one derived price per day and symbol, also backs the upsert lookups
+        await get_derived_prices_collection(_mongo_client[MONGO_DB_NAME]).create_index(
+            [('date', ASCENDING), ('symbol', ASCENDING)], unique=True
+        )
+
+        # only the listener and the processor talk to Redis, a handful of connections is plenty
+        # redis-py already sets TCP_NODELAY on its sockets, so pipelines go out immediately
+        _redis_client = redis.Redis(
+            host=REDIS_HOST, port=REDIS_PORT, decode_responses=True,
+            max_connections=4, socket_keepalive=True, health_check_interval=30, client_name='bilira-btcusdt'
+        )
         await _redis_client.ping() # ensuring connection
         logging.info(f"Redis connected successfully to {REDIS_HOST}:{REDIS_PORT}")
     
@@ -45,7 +70,7 @@ async def close_databases():
         logging.info("MongoDB connection closed.")
 
 async def save_derived_price(db, day_date: date, price: float, symbol: str):
-    collection = db['daily_derived_prices']
+    collection = get_derived_prices_collection(db)
     date_str = day_date.isoformat() # string date as key
     logging.debug(f"Saving derived price to Mongo: Date={date_str}, Price={price}, Symbol={symbol}")
     try:
@@ -58,29 +83,66 @@ async def save_derived_price(db, day_date: date, price: float, symbol: str):
     except Exception as e:
         logging.error(f"Failed to save derived price for {date_str} / {symbol}: {e}", exc_info=True)
 
-async def add_derived_price_to_cache(redis_client, symbol: str, price: float, max_len: int = 250):
+async def update_derived_price_cache(redis_client, symbol: str, price: float, max_len: int = 250, sma_periods: tuple[int, ...] = ()) -> tuple[int, dict[int, float | None], tuple[float | None, float | None]]:
+    # pushes the new daily price and returns what the crossover check needs: (price count, SMAs, previous SMAs)
     key = f"prices:{symbol}:derived_1d"
+    order_key = f"{key}:order"
     logging.debug(f"Adding derived price to Redis Cache: Key={key}, Price={price}")
     try:
-        # LPUSH adds to the beginning (left) of the list
-        await redis_client.lpush(key, str(price))
-        # LTRIM keeps only the latest `max_len` elements
-        await redis_client.ltrim(key, 0, max_len - 1)
-        logging.debug(f"Successfully updated Redis cache for {symbol}")
+        # everything read before the push goes out in one round-trip
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.llen(key)
+            pipe.get(order_key)
+            pipe.hgetall(f"previous_sma:{symbol}")
+            for period in sma_periods:
+                # price leaving the window once the new one is pushed (None while the window is not full yet)
+                pipe.lindex(key, -period)
+                pipe.get(f"sma_sum:{symbol}:{period}")
+            price_count, list_order, previous_sma_values, *window_state = await pipe.execute()
+
+        discard_list = price_count > 0 and list_order != PRICE_LIST_ORDER
+        if discard_list:
+            # written newest-at-head (LPUSH) before the switch to RPUSH, or by something else, so order is unknown
+            logging.error(f"Redis cache '{key}' has no '{PRICE_LIST_ORDER}' order marker, discarding its {price_count} prices. SMAs are unavailable until history is backfilled again (restart the app).")
+            price_count = 0
+            previous_sma_values = {} # those SMAs came from the discarded list too
+
+        window_sums = {}
+        for period, evicted, window_sum in zip(sma_periods, window_state[::2], window_state[1::2]):
+            if price_count == 0:
+                old_sum, evicted = 0.0, None
+            elif window_sum is None:
+                # the list exists but its sum doesn't (never seeded or evicted), rebuild it from the list
+                logging.warning(f"Running sum for SMA{period} of {symbol} missing, rebuilding it from '{key}'.")
+                old_sum = sum(float(p) for p in await redis_client.lrange(key, -period, -1))
+            else:
+                old_sum = float(window_sum)
+            window_sums[period] = old_sum + price - (float(evicted) if evicted is not None else 0.0)
+
+        price_count = min(price_count + 1, max_len)
+        smas = {period: window_sum / period if price_count >= period else None for period, window_sum in window_sums.items()}
+        # and everything written in a second one, atomically so the list and its sums never drift apart
+        async with redis_client.pipeline(transaction=True) as pipe:
+            if discard_list:
+                pipe.delete(key, f"previous_sma:{symbol}")
+            # the sums are set outright rather than incremented, so a rebuilt sum replaces whatever was stored
+            for period, window_sum in window_sums.items():
+                pipe.set(f"sma_sum:{symbol}:{period}", str(window_sum))
+            # storing the new SMAs for the *next* day's comparison once all of them are calculable
+            # the old values were already read above, so this costs no extra round-trip
+            if smas and None not in smas.values():
+                pipe.hset(f"previous_sma:{symbol}", mapping={f'sma_{period}': str(sma) for period, sma in smas.items()})
+            # RPUSH adds to the end (right) of the list, newest price is at the tail
+            pipe.rpush(key, price)
+            # LTRIM keeps only the latest `max_len` elements
+            pipe.ltrim(key, -max_len, -1)
+            pipe.set(order_key, PRICE_LIST_ORDER)
+            await pipe.execute()
+        logging.debug(f"Successfully updated Redis cache for {symbol}, SMAs: {smas}")
+        return price_count, smas, _parse_previous_smas(previous_sma_values)
     except Exception as e:
         logging.error(f"Failed to update Redis cache for {key}: {e}", exc_info=True)
-
-async def get_prices_from_cache(redis_client, symbol: str, count: int = 200) -> list[float]:
-    key = f"prices:{symbol}:derived_1d"
-    try:
-        # LRANGE 0 to count-1 gets the first 'count' elements (most recent due to LPUSH)
-        price_strings = await redis_client.lrange(key, 0, count - 1)
-        prices = [float(p) for p in price_strings]
-        logging.debug(f"Retrieved {len(prices)} prices from cache for {symbol}")
-        return prices
-    except Exception as e:
-        logging.error(f"Failed to retrieve prices from Redis cache for {key}: {e}", exc_info=True)
-        return []
+        return 0, {period: None for period in sma_periods}, (None, None)
 
 # todo placeholders
 
@@ -100,43 +162,46 @@ async def save_order(db, order_data: dict):
     except Exception as e:
         logging.error(f"Failed to save order: {e}", exc_info=True)
 
-async def get_position(redis_client, symbol: str) -> str | None:
+async def swap_position(redis_client, symbol: str, state: str) -> str | None:
+    # returns the state before the swap, None if the key didn't exist. Redis errors are raised to the caller
     key = f"position:{symbol}"
+    # GET + SET as one atomic round-trip
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.get(key)
+        pipe.set(key, state)
+        position, _ = await pipe.execute()
+    logging.info(f"Swapped position for {symbol}: {position} -> {state}")
+    return position
+
+def _parse_previous_smas(sma_values: dict) -> tuple[float | None, float | None]:
+    sma50 = float(sma_values.get('sma_50')) if sma_values.get('sma_50') else None
+    sma200 = float(sma_values.get('sma_200')) if sma_values.get('sma_200') else None
+    return sma50, sma200
+
+# deletes the lock only while it still holds our token, so an expired holder can't free someone else's lock
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+async def acquire_lock(redis_client, name: str, ttl: int = 60) -> str | None:
+    # returns the lock token, or None if someone else holds the lock. Redis errors are raised to the caller
+    key = f"lock:{name}"
+    token = secrets.token_hex(16)
+    # SET NX EX, expires on its own if the holder dies before releasing
+    if await redis_client.set(key, token, nx=True, ex=ttl):
+        return token
+    return None
+
+async def release_lock(redis_client, name: str, token: str):
+    key = f"lock:{name}"
     try:
-        position = await redis_client.get(key)
-        return position # returns None if key doesn't exist
-    except Exception as e:
-        logging.error(f"Failed to get position for {symbol}: {e}", exc_info=True)
-        return None # indicate error or inability to fetch
-
-async def set_position(redis_client, symbol: str, state: str):
-    key = f"position:{symbol}"
-    logging.info(f"Setting position for {symbol} to {state}")
-    try:
-        await redis_client.set(key, state)
-    except Exception as e:
-        logging.error(f"Failed to set position for {symbol}: {e}", exc_info=True)
-
-async def get_previous_smas(redis_client, symbol: str) -> tuple[float | None, float | None]:
-    key = f"previous_sma:{symbol}"
-    try:
-        # HGETALL to get both values at once
-        sma_values = await redis_client.hgetall(key)
-        sma50 = float(sma_values.get('sma_50')) if sma_values.get('sma_50') else None
-        sma200 = float(sma_values.get('sma_200')) if sma_values.get('sma_200') else None
-        return sma50, sma200
-    except Exception as e:
-        logging.error(f"Failed to get previous SMAs for {symbol}: {e}", exc_info=True)
-        return None, None
-
-async def set_previous_smas(redis_client, symbol: str, sma_short: float, sma_long: float):
-    key = f"previous_sma:{symbol}"
-    logging.debug(f"Setting previous SMAs for {symbol}: 50={sma_short}, 200={sma_long}")
-    try:
-        # HMSET or HSET multiple fields
-        await redis_client.hset(key, mapping={'sma_50': str(sma_short), 'sma_200': str(sma_long)})
+        if not await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, key, token):
+            logging.warning(f"Lock {key} expired before release, it may now be held by someone else.")
     except Exception as e:
-        logging.error(f"Failed to set previous SMAs for {symbol}: {e}", exc_info=True)
+        logging.warning(f"Could not release lock {key}: {e}")
 
 async def update_websocket_status(redis_client, status: str):
     key = "websocket_status:BTCUSDT" # example key
@@ -9,42 +9,31 @@ SHORT_SMA_PERIOD = 50
 LONG_SMA_PERIOD = 200
 SYMBOL = historical.SYMBOL
 
-def calculate_sma(prices: list[float], period: int) -> float | None:
-    if not prices or len(prices) < period:
-        return None # not enough data
-    # most recent 'period' prices (which are at the start of the list due to LPUSH)
-    relevant_prices = prices[:period]
-    try:
-        return sum(relevant_prices) / period
-    except ZeroDivisionError:
-        return None # should not happen if len check passes, just in case
-
-async def check_sma_crossover(redis_client, mongo_db, calculation_date: date, derived_close_price: float):
+async def check_sma_crossover(redis_client, mongo_db, calculation_date: date, derived_close_price: float,
+                              price_count: int, smas: dict[int, float | None], previous_smas: tuple[float | None, float | None]):
     # this function is triggered after a new daily price is derived and saved
-    logging.info(f"[{SYMBOL}] Checking SMA crossover for date: {calculation_date}")
-
-    # fetch required price history from Redis cache
+    # price_count, smas and previous_smas come pre-fetched from persistence.update_derived_price_cache
     # need at least LONG_SMA_PERIOD prices for the longest SMA
-    prices = await persistence.get_prices_from_cache(redis_client, SYMBOL, count=LONG_SMA_PERIOD)
+    logging.info(f"[{SYMBOL}] Checking SMA crossover for date: {calculation_date}")
 
-    if not prices:
+    if not price_count:
         logging.warning(f"[{SYMBOL}] No prices found in cache. Cannot calculate SMAs for {calculation_date}.")
         return
 
     # check if enough data exists
-    if len(prices) < LONG_SMA_PERIOD:
-        logging.warning(f"[{SYMBOL}] Insufficient price data ({len(prices)} points) for {LONG_SMA_PERIOD}-day SMA. Need {LONG_SMA_PERIOD}. Skipping crossover check for {calculation_date}.")
-        # optional: still calculate and store short SMA if possible
-        current_sma_short = calculate_sma(prices, SHORT_SMA_PERIOD)
+    if price_count < LONG_SMA_PERIOD:
+        logging.warning(f"[{SYMBOL}] Insufficient price data ({price_count} points) for {LONG_SMA_PERIOD}-day SMA. Need {LONG_SMA_PERIOD}. Skipping crossover check for {calculation_date}.")
+        # optional: still report the short SMA if possible
+        current_sma_short = smas[SHORT_SMA_PERIOD]
         if current_sma_short is not None:
              # storing only the short SMA if long isn't available yet
              # waits until both are calculable
              logging.info(f"[{SYMBOL}] Short SMA ({SHORT_SMA_PERIOD}d) calculable: {current_sma_short:.2f}, but waiting for enough data for long SMA.")
         return # exit until enough data for both SMAs is available
 
-    # calculate current SMAs
-    current_sma_short = calculate_sma(prices, SHORT_SMA_PERIOD)
-    current_sma_long = calculate_sma(prices, LONG_SMA_PERIOD)
+    # current SMAs straight from the running sums
+    current_sma_short = smas[SHORT_SMA_PERIOD]
+    current_sma_long = smas[LONG_SMA_PERIOD]
 
     if current_sma_short is None or current_sma_long is None:
         logging.error(f"[{SYMBOL}] Failed to calculate one or both SMAs for {calculation_date} even with sufficient data points. Short={current_sma_short}, Long={current_sma_long}")
@@ -52,17 +41,10 @@ async def check_sma_crossover(redis_client, mongo_db, calculation_date: date, de
 
     logging.info(f"[{SYMBOL}] Calculated SMAs for {calculation_date}: SMA{SHORT_SMA_PERIOD}={current_sma_short:.2f}, SMA{LONG_SMA_PERIOD}={current_sma_long:.2f}")
 
-    # fetch previous day's SMAs
-    prev_sma_short, prev_sma_long = await persistence.get_previous_smas(redis_client, SYMBOL)
+    # previous day's SMAs
+    prev_sma_short, prev_sma_long = previous_smas
     logging.debug(f"[{SYMBOL}] Previous SMAs fetched: SMA{SHORT_SMA_PERIOD}={prev_sma_short}, SMA{LONG_SMA_PERIOD}={prev_sma_long}")
-
-
-    # storing current SMAs for the *next* day's comparison
-    try:
-         await persistence.set_previous_smas(redis_client, SYMBOL, current_sma_short, current_sma_long)
-         logging.debug(f"[{SYMBOL}] Stored current SMAs ({current_sma_short:.2f}, {current_sma_long:.2f}) as 'previous' for next calculation.")
-    except Exception as e:
-         logging.error(f"[{SYMBOL}] Failed to store current SMAs in Redis: {e}", exc_info=True)
+    # current SMAs were already stored as 'previous' for the next day's comparison in the same cache update
 
     # crossover Detection (requires previous values)
     if prev_sma_short is None or prev_sma_long is None:
@@ -98,10 +80,10 @@ async def check_sma_crossover(redis_client, mongo_db, calculation_date: date, de
             'calculation_ran_at': datetime.now(timezone.utc) # record when this logic actually ran
         }
 
-        await persistence.save_signal(mongo_db, signal_data)
-
         logging.info(f"[{SYMBOL}] Triggering Order Manager for {signal} signal...")
-        asyncio.create_task(
+        # signal and order writes are independent, let them overlap
+        await asyncio.gather(
+            persistence.save_signal(mongo_db, signal_data),
             order_manager.process_signal(
                 redis_client=redis_client,
                 mongo_db=mongo_db,